@@ -4,68 +4,113 @@ Generate a formatted PR comment from security scan results
 """
 
 import argparse
-import json
+import heapq
+from operator import itemgetter
 from pathlib import Path
-from datetime import datetime
-from collections import defaultdict
+from datetime import datetime, timezone
 
-def load_checkov_results(results_dir: Path) -> dict:
-    """Load Checkov results from JSON file"""
-    checkov_file = results_dir / "results_json.json"
-    if not checkov_file.exists():
-        return {}
-    
-    with open(checkov_file, 'r') as f:
-        return json.load(f)
+from results import load_checkov_results, load_normalized_findings
+from severity import SEVERITIES, classify, critical_row, high_row
+
+# Static parts of the comment; the variable-length sections are written between them
+PR_COMMENT_HEADER = """\
+## 🔒 Security Scan Results
+
+**Status:** {status_emoji} {status_text}
+**Scanned at:** {scanned_at}
+
+### 📊 Summary
+
+| Metric | Count |
+|--------|-------|
+| ✅ Passed Checks | {total_passed} |
+| ❌ Failed Checks | {total_failed} |
+
+### 🎯 Severity Breakdown
+
+| Severity | Count | Status |
+|----------|-------|--------|
+| 🔴 Critical | {critical_count} | {critical_status} |
+| 🟠 High | {high_count} | {high_status} |
+| 🟡 Medium | {medium_count} | {medium_status} |
+| ⚪ Low | {low_count} | {low_status} |
+
+"""
+
+NEXT_STEPS_HEADING = """\
+### 🎯 Next Steps
+
+"""
+
+PR_COMMENT_FOOTER = """\
+---
 
-def categorize_by_severity(findings: list) -> dict:
-    """Categorize findings by severity"""
-    severity_map = {
+💡 **View Details:**
+- Download the `security-scan-results` artifact from this workflow run
+- Check the **Security** tab for SARIF analysis
+- Review `scan-results/checkov-results.json` for complete findings
+
+🔧 **Tools Used:** Checkov, tfsec, Terraform Validate
+
+*This comment will be automatically updated on new commits*"""
+
+def join_section(lines: list) -> str:
+    """Join the lines of an optional comment section (empty if no lines)"""
+    if not lines:
+        return ""
+    return "\n".join(lines) + "\n"
+
+def generate_pr_comment(results_dir: Path) -> list:
+    """Generate formatted markdown for PR comment as a list of text chunks"""
+    
+    normalized = load_normalized_findings(results_dir)
+    
+    if normalized:
+        # Findings were already classified by scan.py
+        summary = normalized.get('summary', {})
+        failed_checks = normalized.get('findings', [])
+    else:
+        checkov_data = load_checkov_results(results_dir)
+        
+        if not checkov_data:
+            return ["⚠️ Could not load security scan results"]
+        
+        # Extract data
+        summary = checkov_data.get('summary', {})
+        failed_checks = checkov_data.get('results', {}).get('failed_checks', [])
+    
+    # Categorize findings and tally affected files in a single pass, keeping
+    # each finding as a (check_name, resource, file_path, line_range) tuple
+    severity_findings = {
         'CRITICAL': [],
         'HIGH': [],
         'MEDIUM': [],
         'LOW': []
     }
+    file_counts = {}
     
-    for finding in findings:
-        check_id = finding.get('check_id', '')
-        
-        # Map check IDs to severity (enhanced logic)
-        if any(cid in check_id for cid in ['CKV_GCP_62', 'CKV_GCP_6', 'CKV_GCP_14']):
-            severity = 'CRITICAL'
-        elif 'CKV_GCP' in check_id or 'CKV_AWS' in check_id:
-            severity = 'HIGH'
-        elif 'CKV2' in check_id:
-            severity = 'MEDIUM'
+    # Bind hot names locally for the per-finding loop
+    presorted = bool(normalized)
+    _classify = classify
+    _severities = SEVERITIES
+    _file_count = file_counts.get
+    
+    for finding in failed_checks:
+        _get = finding.get
+        if presorted:
+            severity = _get('severity')
         else:
-            severity = 'LOW'
+            severity = _severities[_classify(_get('check_id') or '')]
+        file_path = _get('file_path', '').lstrip('/')
+        severity_findings[severity].append((
+            _get('check_name', 'Unknown'),
+            _get('resource', 'Unknown'),
+            file_path,
+            _get('file_line_range', [0, 0])
+        ))
         
-        finding['severity'] = severity
-        severity_map[severity].append(finding)
-    
-    return severity_map
-
-def truncate_text(text: str, max_length: int = 80) -> str:
-    """Truncate text to max length"""
-    if len(text) <= max_length:
-        return text
-    return text[:max_length-3] + "..."
-
-def generate_pr_comment(results_dir: Path) -> str:
-    """Generate formatted markdown for PR comment"""
-    
-    checkov_data = load_checkov_results(results_dir)
-    
-    if not checkov_data:
-        return "⚠️ Could not load security scan results"
-    
-    # Extract data
-    summary = checkov_data.get('summary', {})
-    failed_checks = checkov_data.get('results', {}).get('failed_checks', [])
-    passed_checks = checkov_data.get('results', {}).get('passed_checks', [])
-    
-    # Categorize findings
-    severity_findings = categorize_by_severity(failed_checks)
+        if file_path:
+            file_counts[file_path] = _file_count(file_path, 0) + 1
     
     # Count by severity
     critical_count = len(severity_findings['CRITICAL'])
@@ -90,37 +135,8 @@ def generate_pr_comment(results_dir: Path) -> str:
         status_emoji = "🟢"
         status_text = "PASSED - No critical/high issues"
     
-    # Build comment
-    lines = []
-    
-    # Header
-    lines.append("## 🔒 Security Scan Results")
-    lines.append("")
-    lines.append(f"**Status:** {status_emoji} {status_text}")
-    lines.append(f"**Scanned at:** {datetime.now().strftime('%Y-%m-%d %H:%M:%S UTC')}")
-    lines.append("")
-    
-    # Summary statistics
-    lines.append("### 📊 Summary")
-    lines.append("")
-    lines.append("| Metric | Count |")
-    lines.append("|--------|-------|")
-    lines.append(f"| ✅ Passed Checks | {total_passed} |")
-    lines.append(f"| ❌ Failed Checks | {total_failed} |")
-    lines.append("")
-    
-    # Severity breakdown
-    lines.append("### 🎯 Severity Breakdown")
-    lines.append("")
-    lines.append("| Severity | Count | Status |")
-    lines.append("|----------|-------|--------|")
-    lines.append(f"| 🔴 Critical | {critical_count} | {'⛔ Must Fix' if critical_count > 0 else '✅'} |")
-    lines.append(f"| 🟠 High | {high_count} | {'⚠️ Should Fix' if high_count > 0 else '✅'} |")
-    lines.append(f"| 🟡 Medium | {medium_count} | {'📝 Consider' if medium_count > 0 else '✅'} |")
-    lines.append(f"| ⚪ Low | {low_count} | {'ℹ️ Optional' if low_count > 0 else '✅'} |")
-    lines.append("")
-    
     # Critical findings (show all)
+    lines = []
     if critical_count > 0:
         lines.append("### 🔴 Critical Issues (Must Fix)")
         lines.append("")
@@ -131,13 +147,7 @@ def generate_pr_comment(results_dir: Path) -> str:
         lines.append("|-------|----------|------|-------|")
         
         for finding in severity_findings['CRITICAL'][:10]:  # Limit to 10
-            check_name = truncate_text(finding.get('check_name', 'Unknown'), 50)
-            resource = truncate_text(finding.get('resource', 'Unknown'), 40)
-            file_path = finding.get('file_path', '').lstrip('/')
-            lines_range = finding.get('file_line_range', [0, 0])
-            line_str = f"{lines_range[0]}-{lines_range[1]}" if len(lines_range) == 2 else "N/A"
-            
-            lines.append(f"| {check_name} | `{resource}` | `{file_path}` | {line_str} |")
+            lines.append(critical_row(*finding))
         
         if critical_count > 10:
             lines.append("")
@@ -146,8 +156,10 @@ def generate_pr_comment(results_dir: Path) -> str:
         lines.append("")
         lines.append("</details>")
         lines.append("")
+    critical_section = join_section(lines)
     
     # High findings (show top 10)
+    lines = []
     if high_count > 0:
         lines.append("### 🟠 High Severity Issues")
         lines.append("")
@@ -157,12 +169,8 @@ def generate_pr_comment(results_dir: Path) -> str:
         lines.append("| Check | Resource | File |")
         lines.append("|-------|----------|------|")
         
-        for finding in severity_findings['HIGH'][:10]:
-            check_name = truncate_text(finding.get('check_name', 'Unknown'), 50)
-            resource = truncate_text(finding.get('resource', 'Unknown'), 40)
-            file_path = finding.get('file_path', '').lstrip('/')
-            
-            lines.append(f"| {check_name} | `{resource}` | `{file_path}` |")
+        for check_name, resource, file_path, _ in severity_findings['HIGH'][:10]:
+            lines.append(high_row(check_name, resource, file_path))
         
         if high_count > 10:
             lines.append("")
@@ -171,8 +179,10 @@ def generate_pr_comment(results_dir: Path) -> str:
         lines.append("")
         lines.append("</details>")
         lines.append("")
+    high_section = join_section(lines)
     
     # Medium findings (summarized)
+    lines = []
     if medium_count > 0:
         lines.append("### 🟡 Medium Severity Issues")
         lines.append("")
@@ -180,9 +190,7 @@ def generate_pr_comment(results_dir: Path) -> str:
         lines.append(f"<summary>{medium_count} medium severity issues found (click to expand top 5)</summary>")
         lines.append("")
         
-        for finding in severity_findings['MEDIUM'][:5]:
-            check_name = finding.get('check_name', 'Unknown')
-            resource = finding.get('resource', 'Unknown')
+        for check_name, resource, _, _ in severity_findings['MEDIUM'][:5]:
             lines.append(f"- {check_name} in `{resource}`")
         
         if medium_count > 5:
@@ -191,35 +199,28 @@ def generate_pr_comment(results_dir: Path) -> str:
         lines.append("")
         lines.append("</details>")
         lines.append("")
+    medium_section = join_section(lines)
     
     # Low findings (just count)
-    if low_count > 0:
-        lines.append(f"### ⚪ Low Severity: {low_count} issues")
-        lines.append("")
+    low_section = f"### ⚪ Low Severity: {low_count} issues\n\n" if low_count > 0 else ""
     
     # Top affected files
-    file_counts = defaultdict(int)
-    for finding in failed_checks:
-        file_path = finding.get('file_path', '').lstrip('/')
-        if file_path:
-            file_counts[file_path] += 1
-    
+    lines = []
     if file_counts:
         lines.append("### 📁 Most Affected Files")
         lines.append("")
         lines.append("| File | Issues |")
         lines.append("|------|--------|")
         
-        sorted_files = sorted(file_counts.items(), key=lambda x: x[1], reverse=True)[:5]
+        sorted_files = heapq.nlargest(5, file_counts.items(), key=itemgetter(1))
         for file_path, count in sorted_files:
             lines.append(f"| `{file_path}` | {count} |")
         
         lines.append("")
+    files_section = join_section(lines)
     
     # Action items
-    lines.append("### 🎯 Next Steps")
-    lines.append("")
-    
+    lines = []
     if critical_count > 0:
         lines.append("⛔ **Action Required:**")
         lines.append(f"- Fix {critical_count} critical security issue(s) before merging")
@@ -234,20 +235,35 @@ def generate_pr_comment(results_dir: Path) -> str:
         lines.append("📝 **Consider:**")
         lines.append(f"- Review and address medium/low severity findings when possible")
         lines.append("")
+    next_steps = join_section(lines)
     
-    # Footer
-    lines.append("---")
-    lines.append("")
-    lines.append("💡 **View Details:**")
-    lines.append("- Download the `security-scan-results` artifact from this workflow run")
-    lines.append("- Check the **Security** tab for SARIF analysis")
-    lines.append("- Review `scan-results/checkov-results.json` for complete findings")
-    lines.append("")
-    lines.append("🔧 **Tools Used:** Checkov, tfsec, Terraform Validate")
-    lines.append("")
-    lines.append("*This comment will be automatically updated on new commits*")
+    header = PR_COMMENT_HEADER.format(
+        status_emoji=status_emoji,
+        status_text=status_text,
+        scanned_at=datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC'),
+        total_passed=total_passed,
+        total_failed=total_failed,
+        critical_count=critical_count,
+        high_count=high_count,
+        medium_count=medium_count,
+        low_count=low_count,
+        critical_status='⛔ Must Fix' if critical_count > 0 else '✅',
+        high_status='⚠️ Should Fix' if high_count > 0 else '✅',
+        medium_status='📝 Consider' if medium_count > 0 else '✅',
+        low_status='ℹ️ Optional' if low_count > 0 else '✅'
+    )
     
-    return "\n".join(lines)
+    return [
+        header,
+        critical_section,
+        high_section,
+        medium_section,
+        low_section,
+        files_section,
+        NEXT_STEPS_HEADING,
+        next_steps,
+        PR_COMMENT_FOOTER
+    ]
 
 def main():
     parser = argparse.ArgumentParser(description="Generate PR comment from security scan results")
@@ -262,11 +278,11 @@ def main():
         return 1
     
     # Generate comment
-    comment = generate_pr_comment(results_dir)
+    comment_chunks = generate_pr_comment(results_dir)
     
-    # Write to file
+    # Write to file without joining the chunks first
     with open(args.output, 'w') as f:
-        f.write(comment)
+        f.writelines(comment_chunks)
     
     print(f"✓ PR comment generated: {args.output}")
     return 0
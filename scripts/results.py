@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Loaders for scan results, shared by the pipeline scripts
+"""
+
+from pathlib import Path
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+CHECKOV_RESULTS_FILE = "results_json.json"
+NORMALIZED_FILE = "findings-normalized.json"
+
+def load_normalized_findings(results_dir: Path) -> dict:
+    """Load findings already classified by scan.py, if newer than Checkov results"""
+    normalized_file = results_dir / NORMALIZED_FILE
+    checkov_file = results_dir / CHECKOV_RESULTS_FILE
+    if not normalized_file.exists():
+        return {}
+    if checkov_file.exists() and checkov_file.stat().st_mtime > normalized_file.stat().st_mtime:
+        return {}
+    
+    with open(normalized_file, 'rb') as f:
+        return json_loads(f.read())
+
+def checkov_results(summary, failed_checks) -> dict:
+    """Shape summary and failed checks for callers, or {} if neither was found"""
+    if summary is None and failed_checks is None:
+        return {}
+    return {'summary': summary or {}, 'results': {'failed_checks': failed_checks or []}}
+
+def reduce_checkov_report(report) -> dict:
+    """Reduce a fully parsed Checkov report to summary and failed checks"""
+    # Only a single-framework report (a JSON object) is understood
+    if not isinstance(report, dict):
+        return {}
+    
+    # With no resources to scan, Checkov writes just the bare summary; that
+    # is a valid scan with zero findings
+    if 'summary' not in report and 'results' not in report and 'failed' in report:
+        return checkov_results(report, [])
+    
+    results = report.get('results')
+    failed_checks = results.get('failed_checks') if isinstance(results, dict) else None
+    return checkov_results(report.get('summary'), failed_checks)
+
+def load_checkov_results(results_dir: Path) -> dict:
+    """Load Checkov summary and failed checks from JSON file"""
+    checkov_file = results_dir / CHECKOV_RESULTS_FILE
+    if not checkov_file.exists():
+        return {}
+    
+    with open(checkov_file, 'rb') as f:
+        if ijson is None:
+            return reduce_checkov_report(json_loads(f.read()))
+        
+        if next(ijson.parse(f), (None, None, None))[1] != 'start_map':
+            return {}
+        
+        # Stream only the parts we use so passed_checks is never materialized
+        f.seek(0)
+        summary = next(ijson.items(f, 'summary', use_float=True), None)
+        f.seek(0)
+        failed_checks = next(ijson.items(f, 'results.failed_checks', use_float=True), None)
+        
+        if summary is None and failed_checks is None:
+            # Neither part present, so the report is small: check it whole
+            f.seek(0)
+            return reduce_checkov_report(next(ijson.items(f, '', use_float=True), None))
+    
+    return checkov_results(summary, failed_checks)
@@ -5,14 +5,31 @@ Orchestrates multiple security scanning tools for Infrastructure-as-Code
 """
 
 import argparse
-import json
+import re
 import subprocess
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Tuple
-from datetime import datetime
+from datetime import datetime, timezone
 import os
 
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    import json
+    from json import loads as json_loads
+    
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+from results import CHECKOV_RESULTS_FILE, NORMALIZED_FILE
+from severity import SEVERITIES, categorize_severity, classify
+
+# Matches any ANSI SGR escape sequence, i.e. everything Colors emits
+_ANSI_RE = re.compile(r'\x1b\[[0-9;]*m')
+
 class Colors:
     """ANSI color codes for terminal output"""
     RED = '\033[91m'
@@ -33,16 +50,83 @@ class SecurityScanner:
             "terraform_validate": None
         }
         
+        # Single timestamp shared by every tool result and the report
+        self._started = datetime.now(timezone.utc)
+        self._started_iso = self._started.isoformat()
+        self._started_str = self._started.strftime('%Y-%m-%d %H:%M:%S UTC')
+        
+        # Scans run concurrently: each thread buffers its own section of
+        # output and writes it to stdout in one block
+        self._print_lock = threading.Lock()
+        self._output = threading.local()
+        
+    def _emit(self, text: str = ""):
+        """Buffer a line of output for the current section"""
+        lines = getattr(self._output, "lines", None)
+        if lines is None:
+            lines = self._output.lines = []
+        lines.append(text)
+    
+    def flush_output(self):
+        """Write the buffered output of the current section to stdout"""
+        lines = getattr(self._output, "lines", None)
+        if not lines:
+            return
+        with self._print_lock:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+        lines.clear()
+    
     def print_header(self, text: str):
         """Print formatted section header"""
-        print(f"\n{Colors.BLUE}{Colors.BOLD}{'='*60}{Colors.END}")
-        print(f"{Colors.BLUE}{Colors.BOLD}{text}{Colors.END}")
-        print(f"{Colors.BLUE}{Colors.BOLD}{'='*60}{Colors.END}\n")
+        self._emit(f"\n{Colors.BLUE}{Colors.BOLD}{'='*60}{Colors.END}")
+        self._emit(f"{Colors.BLUE}{Colors.BOLD}{text}{Colors.END}")
+        self._emit(f"{Colors.BLUE}{Colors.BOLD}{'='*60}{Colors.END}\n")
     
     def print_status(self, tool: str, status: str, details: str = ""):
         """Print tool execution status"""
         status_color = Colors.GREEN if status == "PASS" else Colors.RED if status == "FAIL" else Colors.YELLOW
-        print(f"[{status_color}{status}{Colors.END}] {tool}: {details}")
+        self._emit(f"[{status_color}{status}{Colors.END}] {tool}: {details}")
+    
+    def _terraform_env(self) -> Dict[str, str]:
+        """Environment for terraform commands, with a shared provider plugin cache"""
+        env = {**os.environ, "TF_IN_AUTOMATION": "1"}
+        plugin_cache = env.setdefault(
+            "TF_PLUGIN_CACHE_DIR",
+            str(Path.home() / ".terraform.d" / "plugin-cache")
+        )
+        Path(plugin_cache).mkdir(parents=True, exist_ok=True)
+        return env
+    
+    def _terraform_init(self, env: Dict[str, str]):
+        """Initialize terraform (without backend)"""
+        init_cmd = ["terraform", "init", "-backend=false", "-input=false", "-lock=false"]
+        subprocess.run(
+            init_cmd,
+            cwd=self.scan_path,
+            capture_output=True,
+            check=True,
+            env=env
+        )
+    
+    def _terraform_validate(self, env: Dict[str, str]) -> Dict:
+        """Run terraform validate and parse its JSON output"""
+        # stdout is JSON, parsed straight from bytes
+        validate_cmd = ["terraform", "validate", "-json"]
+        process = subprocess.run(
+            validate_cmd,
+            cwd=self.scan_path,
+            capture_output=True,
+            env=env
+        )
+        return json_loads(process.stdout)
+    
+    def _needs_init(self, output: Dict) -> bool:
+        """Check whether validate failed on missing providers or modules"""
+        return any(
+            "terraform init" in f"{d.get('summary', '')} {d.get('detail', '')}"
+            for d in output.get("diagnostics", [])
+        )
     
     def run_terraform_validate(self) -> Tuple[bool, Dict]:
         """Run terraform validate"""
@@ -51,30 +135,22 @@ class SecurityScanner:
         result = {
             "passed": False,
             "errors": [],
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self._started_iso
         }
         
         try:
-            # Initialize terraform (without backend)
-            init_cmd = ["terraform", "init", "-backend=false"]
-            subprocess.run(
-                init_cmd,
-                cwd=self.scan_path,
-                capture_output=True,
-                check=True,
-                text=True
-            )
+            env = self._terraform_env()
             
-            # Run validation
-            validate_cmd = ["terraform", "validate", "-json"]
-            process = subprocess.run(
-                validate_cmd,
-                cwd=self.scan_path,
-                capture_output=True,
-                text=True
-            )
+            # Reuse an existing .terraform directory, but re-run init if it
+            # turns out to be stale (validate reports missing providers/modules)
+            initialized = (self.scan_path / ".terraform").exists()
+            if not initialized:
+                self._terraform_init(env)
             
-            output = json.loads(process.stdout)
+            output = self._terraform_validate(env)
+            if initialized and not output.get("valid", False) and self._needs_init(output):
+                self._terraform_init(env)
+                output = self._terraform_validate(env)
             
             if output.get("valid", False):
                 result["passed"] = True
@@ -86,13 +162,13 @@ class SecurityScanner:
                 
                 # Print errors
                 for error in result["errors"]:
-                    print(f"  {Colors.RED}✗{Colors.END} {error.get('summary', 'Unknown error')}")
+                    self._emit(f"  {Colors.RED}✗{Colors.END} {error.get('summary', 'Unknown error')}")
                     if error.get('detail'):
-                        print(f"    {error['detail']}")
+                        self._emit(f"    {error['detail']}")
             
         except subprocess.CalledProcessError as e:
             result["passed"] = False
-            result["errors"] = [{"summary": "Terraform command failed", "detail": e.stderr}]
+            result["errors"] = [{"summary": "Terraform command failed", "detail": e.stderr.decode('utf-8', 'replace')}]
             self.print_status("Terraform Validate", "FAIL", "Command execution failed")
         except Exception as e:
             result["passed"] = False
@@ -100,19 +176,20 @@ class SecurityScanner:
             self.print_status("Terraform Validate", "FAIL", str(e))
         
         self.results["terraform_validate"] = result
+        self.flush_output()
         return result["passed"], result
     
     def run_checkov(self) -> Tuple[bool, Dict]:
         """Run Checkov security scanner"""
         self.print_header("Running Checkov")
         
-        output_file = self.output_dir / "results_json.json"
+        output_file = self.output_dir / CHECKOV_RESULTS_FILE
         
         result = {
             "passed": False,
             "summary": {},
             "findings": [],
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self._started_iso
         }
         
         try:
@@ -126,16 +203,17 @@ class SecurityScanner:
                 "--soft-fail"  # Don't exit with error code
             ]
             
+            # Results are written to output_file, so only stderr is kept
             process = subprocess.run(
                 cmd,
-                capture_output=True,
-                text=True
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE
             )
             
             # Read the JSON output
             if output_file.exists():
-                with open(output_file, 'r') as f:
-                    checkov_output = json.load(f)
+                with open(output_file, 'rb') as f:
+                    checkov_output = json_loads(f.read())
                 
                 # Parse results
                 summary = checkov_output.get("summary", {})
@@ -146,20 +224,42 @@ class SecurityScanner:
                     "parsing_errors": summary.get("parsing_errors", 0)
                 }
                 
-                # Extract failed checks
+                # Extract failed checks, counting severities as we go
+                severity_counts = {}
+                
+                # Bind hot names locally for the per-finding loop
+                _classify = classify
+                _severities = SEVERITIES
+                _count = severity_counts.get
+                _append = result["findings"].append
+                
                 for check_type in checkov_output.get("results", {}).get("failed_checks", []):
-                    result["findings"].append({
-                        "check_id": check_type.get("check_id"),
-                        "check_name": check_type.get("check_name"),
-                        "file": check_type.get("file_path"),
-                        "resource": check_type.get("resource"),
-                        "severity": self._map_checkov_severity(check_type.get("check_id")),
-                        "guideline": check_type.get("guideline", "")
+                    _get = check_type.get
+                    check_id = _get("check_id") or ""
+                    severity = _severities[_classify(check_id)]
+                    severity_counts[severity] = _count(severity, 0) + 1
+                    _append({
+                        "check_id": check_id,
+                        "check_name": _get("check_name") or "Unknown",
+                        "file_path": _get("file_path") or "",
+                        "file_line_range": _get("file_line_range") or [0, 0],
+                        "resource": _get("resource") or "Unknown",
+                        "severity": severity,
+                        "guideline": _get("guideline", "")
                     })
                 
+                # Save the classified findings so security-gate.py and
+                # generate-pr-comment.py don't re-parse and re-classify
+                normalized_file = self.output_dir / NORMALIZED_FILE
+                normalized_file.write_bytes(json_dumps({
+                    "summary": result["summary"],
+                    "counts": severity_counts,
+                    "findings": result["findings"]
+                }))
+                
                 # Determine pass/fail
-                critical_count = sum(1 for f in result["findings"] if f["severity"] == "CRITICAL")
-                high_count = sum(1 for f in result["findings"] if f["severity"] == "HIGH")
+                critical_count = severity_counts.get("CRITICAL", 0)
+                high_count = severity_counts.get("HIGH", 0)
                 
                 result["passed"] = critical_count == 0 and high_count <= 5
                 
@@ -170,23 +270,22 @@ class SecurityScanner:
                     f"Passed: {result['summary']['passed']}, Failed: {result['summary']['failed']}"
                 )
                 
-                print(f"\n  Severity Breakdown:")
-                severity_counts = {}
-                for finding in result["findings"]:
-                    sev = finding["severity"]
-                    severity_counts[sev] = severity_counts.get(sev, 0) + 1
-                
+                self._emit(f"\n  Severity Breakdown:")
                 for severity in ["CRITICAL", "HIGH", "MEDIUM", "LOW"]:
                     count = severity_counts.get(severity, 0)
                     if count > 0:
                         color = Colors.RED if severity == "CRITICAL" else Colors.YELLOW if severity == "HIGH" else Colors.END
-                        print(f"    {color}{severity}: {count}{Colors.END}")
+                        self._emit(f"    {color}{severity}: {count}{Colors.END}")
+            else:
+                result["error"] = process.stderr.decode('utf-8', 'replace').strip()
+                self.print_status("Checkov", "FAIL", f"No results written to {output_file}")
             
         except Exception as e:
             self.print_status("Checkov", "FAIL", str(e))
             result["error"] = str(e)
         
         self.results["checkov"] = result
+        self.flush_output()
         return result["passed"], result
     
     def run_tfsec(self) -> Tuple[bool, Dict]:
@@ -196,7 +295,7 @@ class SecurityScanner:
         result = {
             "passed": False,
             "findings": [],
-            "timestamp": datetime.now().isoformat()
+            "timestamp": self._started_iso
         }
         
         # Check if tfsec is installed
@@ -206,6 +305,7 @@ class SecurityScanner:
             self.print_status("tfsec", "SKIP", "tfsec not installed (optional)")
             result["skipped"] = True
             self.results["tfsec"] = result
+            self.flush_output()
             return True, result
         
         try:
@@ -216,14 +316,14 @@ class SecurityScanner:
                 "--soft-fail"
             ]
             
+            # stdout is JSON, parsed straight from bytes
             process = subprocess.run(
                 cmd,
-                capture_output=True,
-                text=True
+                capture_output=True
             )
             
             if process.stdout:
-                tfsec_output = json.loads(process.stdout)
+                tfsec_output = json_loads(process.stdout)
                 
                 for finding in tfsec_output.get("results", []):
                     result["findings"].append({
@@ -250,27 +350,19 @@ class SecurityScanner:
             result["error"] = str(e)
         
         self.results["tfsec"] = result
+        self.flush_output()
         return result.get("passed", False), result
     
     def _map_checkov_severity(self, check_id: str) -> str:
         """Map Checkov check IDs to severity levels"""
-        # Simple heuristic - can be improved with actual severity mapping
-        critical_patterns = ["CKV_GCP_6", "CKV_GCP_62", "CKV_GCP_14"]  # Public access, encryption
-        high_patterns = ["CKV_GCP_", "CKV_AWS_"]
-        
-        if any(pattern in check_id for pattern in critical_patterns):
-            return "CRITICAL"
-        elif any(pattern in check_id for pattern in high_patterns):
-            return "HIGH"
-        else:
-            return "MEDIUM"
+        return categorize_severity(check_id)
     
     def generate_summary_report(self) -> str:
         """Generate a summary report of all scans"""
         self.print_header("Scan Summary")
         
         report_lines = []
-        report_lines.append(f"Security Scan Report - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        report_lines.append(f"Security Scan Report - {self._started_str}")
         report_lines.append(f"Scanned Path: {self.scan_path}")
         report_lines.append("=" * 60)
         report_lines.append("")
@@ -322,28 +414,31 @@ class SecurityScanner:
         report_lines.append(f"Detailed results saved to: {self.output_dir}")
         
         report_text = "\n".join(report_lines)
-        print(report_text)
+        self._emit(report_text)
+        self.flush_output()
         
         # Save to file
         summary_file = self.output_dir / "summary.txt"
         with open(summary_file, 'w') as f:
             # Remove color codes for file
-            clean_text = report_text
-            for color in [Colors.RED, Colors.GREEN, Colors.YELLOW, Colors.BLUE, Colors.BOLD, Colors.END]:
-                clean_text = clean_text.replace(color, '')
-            f.write(clean_text)
+            f.write(_ANSI_RE.sub('', report_text))
         
         return report_text
     
     def run_all_scans(self) -> bool:
         """Run all security scans"""
-        print(f"{Colors.BOLD}Security-as-Code Scanner{Colors.END}")
-        print(f"Scanning: {self.scan_path}\n")
+        self._emit(f"{Colors.BOLD}Security-as-Code Scanner{Colors.END}")
+        self._emit(f"Scanning: {self.scan_path}\n")
+        self.flush_output()
         
-        # Run scans
-        tf_passed, _ = self.run_terraform_validate()
-        checkov_passed, _ = self.run_checkov()
-        tfsec_passed, _ = self.run_tfsec()
+        # Run scans: Checkov (the slowest) runs alongside terraform validate
+        # and tfsec. tfsec stays after validate so it never reads the
+        # .terraform directory while terraform init is still writing it.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            checkov_future = executor.submit(self.run_checkov)
+            tf_passed, _ = self.run_terraform_validate()
+            tfsec_passed, _ = self.run_tfsec()
+            checkov_passed, _ = checkov_future.result()
         
         # Generate summary
         self.generate_summary_report()
@@ -4,36 +4,34 @@ Security Gate - Determines if build should pass or fail based on findings
 """
 
 import argparse
-import json
 import sys
 from pathlib import Path
 
+from results import CHECKOV_RESULTS_FILE, load_checkov_results, load_normalized_findings
+from severity import SEVERITIES, categorize_severity, classify
+
 class SecurityGate:
     def __init__(self, results_dir: Path, max_critical: int = 0, max_high: int = 5):
         self.results_dir = results_dir
         self.max_critical = max_critical
         self.max_high = max_high
     
+    def load_normalized_findings(self) -> dict:
+        """Load findings already classified by scan.py"""
+        return load_normalized_findings(self.results_dir)
+    
     def load_checkov_results(self) -> dict:
-        """Load Checkov results"""
-        checkov_file = self.results_dir / "results_json.json"
+        """Load Checkov summary and failed checks"""
+        checkov_file = self.results_dir / CHECKOV_RESULTS_FILE
         if not checkov_file.exists():
             print(f"❌ Checkov results not found: {checkov_file}")
             return {}
         
-        with open(checkov_file, 'r') as f:
-            return json.load(f)
+        return load_checkov_results(self.results_dir)
     
     def categorize_severity(self, check_id: str) -> str:
         """Map check ID to severity"""
-        if any(cid in check_id for cid in ['CKV_GCP_62', 'CKV_GCP_6', 'CKV_GCP_14']):
-            return 'CRITICAL'
-        elif 'CKV_GCP' in check_id or 'CKV_AWS' in check_id:
-            return 'HIGH'
-        elif 'CKV2' in check_id:
-            return 'MEDIUM'
-        else:
-            return 'LOW'
+        return categorize_severity(check_id)
     
     def evaluate(self) -> bool:
         """Evaluate if security gate passes"""
@@ -41,13 +39,6 @@ class SecurityGate:
         print("Security Gate Evaluation")
         print("=" * 60)
         
-        checkov_data = self.load_checkov_results()
-        if not checkov_data:
-            print("⚠️  No scan results found - failing by default")
-            return False
-        
-        failed_checks = checkov_data.get('results', {}).get('failed_checks', [])
-        
         # Count by severity
         severity_counts = {
             'CRITICAL': 0,
@@ -56,9 +47,22 @@ class SecurityGate:
             'LOW': 0
         }
         
-        for check in failed_checks:
-            severity = self.categorize_severity(check.get('check_id', ''))
-            severity_counts[severity] += 1
+        normalized = self.load_normalized_findings()
+        if normalized:
+            # Severities were already counted by scan.py
+            severity_counts.update(normalized.get('counts', {}))
+        else:
+            checkov_data = self.load_checkov_results()
+            if not checkov_data:
+                print("⚠️  No scan results found - failing by default")
+                return False
+            
+            failed_checks = checkov_data.get('results', {}).get('failed_checks', [])
+            
+            _classify = classify
+            _severities = SEVERITIES
+            for check in failed_checks:
+                severity_counts[_severities[_classify(check.get('check_id') or '')]] += 1
         
         print(f"\nFindings Summary:")
         print(f"  🔴 Critical: {severity_counts['CRITICAL']}")
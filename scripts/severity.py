@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Severity classification and finding formatting shared by the pipeline scripts
+
+Kept free of dynamic features so it can be compiled with mypyc
+(cd scripts && mypyc severity.py); the compiled module is picked up
+automatically and this file is used when it is not present.
+"""
+
+from typing import Final, Sequence, Tuple
+
+SEVERITIES: Final[Tuple[str, ...]] = ('CRITICAL', 'HIGH', 'MEDIUM', 'LOW')
+CRITICAL: Final = 0
+HIGH: Final = 1
+MEDIUM: Final = 2
+LOW: Final = 3
+
+# Check IDs treated as critical (public access, encryption)
+CRITICAL_IDS: Final = frozenset({'CKV_GCP_62', 'CKV_GCP_6', 'CKV_GCP_14'})
+HIGH_PREFIXES: Final = ('CKV_GCP_', 'CKV_AWS_')
+MEDIUM_PREFIX: Final = 'CKV2'
+
+# Column widths used in the PR comment finding tables
+TRUNC_LIMIT_NAME: Final = 50
+TRUNC_LIMIT_RESOURCE: Final = 40
+
+# Row formatters for the critical and high findings tables
+CRITICAL_ROW: Final = "| {} | `{}` | `{}` | {} |".format
+HIGH_ROW: Final = "| {} | `{}` | `{}` |".format
+
+def classify(check_id: str) -> int:
+    """Map check ID to a severity index into SEVERITIES"""
+    if check_id in CRITICAL_IDS:
+        return CRITICAL
+    elif check_id.startswith(HIGH_PREFIXES):
+        return HIGH
+    elif check_id.startswith(MEDIUM_PREFIX):
+        return MEDIUM
+    else:
+        return LOW
+
+def categorize_severity(check_id: str) -> str:
+    """Map check ID to severity"""
+    return SEVERITIES[classify(check_id)]
+
+def truncate_text(text: str, max_length: int = 80) -> str:
+    """Truncate text to max length, marking the cut with an ellipsis"""
+    return text if len(text) <= max_length else text[:max_length-1] + "…"
+
+def critical_row(check_name: str, resource: str, file_path: str, line_range: Sequence[int]) -> str:
+    """Format a row of the critical findings table"""
+    line_str = f"{line_range[0]}-{line_range[1]}" if len(line_range) == 2 else "N/A"
+    return CRITICAL_ROW(
+        truncate_text(check_name, TRUNC_LIMIT_NAME),
+        truncate_text(resource, TRUNC_LIMIT_RESOURCE),
+        file_path,
+        line_str
+    )
+
+def high_row(check_name: str, resource: str, file_path: str) -> str:
+    """Format a row of the high findings table"""
+    return HIGH_ROW(
+        truncate_text(check_name, TRUNC_LIMIT_NAME),
+        truncate_text(resource, TRUNC_LIMIT_RESOURCE),
+        file_path
+    )